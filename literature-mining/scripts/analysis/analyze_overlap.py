@@ -1,31 +1,29 @@
 import os
 import sys
-import json
+import orjson
 from pathlib import Path
 from collections import defaultdict
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 
 # Input/output directories
 RAW_DIR = Path(__file__).resolve().parents[2] / "data" / "short-raw-refs-abs"
 OUT_DIR = Path(__file__).resolve().parents[2] / "reports" / "tables"
 
 
-# Read a JSONL file → list of dicts
+# Read a JSONL file → one dict at a time
 def read_jsonl(p: Path):
-    out = []
-    with p.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            out.append(json.loads(line))
-    return out
+    # Raw bytes: no text decoding or line buffering, orjson reads UTF-8 directly
+    for line in p.read_bytes().splitlines():
+        if line.strip():
+            yield orjson.loads(line)
 
 
 # Read a JSON file → list with one dict
 def read_json(p: Path):
-    with p.open("r", encoding="utf-8") as f:
-        return [json.load(f)]
+    return [orjson.loads(p.read_bytes())]
 
 
 # Normalize DOI to lowercase without prefix
@@ -51,7 +49,7 @@ def infer_query_id(file_path: Path, rec: dict) -> str:
     return rec.get("query_id") or file_path.parent.name
 
 
-# Load all records recursively under RAW_DIR
+# Load all records recursively under RAW_DIR -> query_id -> set(int id)
 def load_all_records(raw_dir: Path):
     files = sorted(
         [*raw_dir.rglob("*.jsonl"), *raw_dir.rglob("*.json")]
@@ -61,77 +59,99 @@ def load_all_records(raw_dir: Path):
         print(f"No raw files in {raw_dir}", file=sys.stderr)
         sys.exit(1)
 
-    q2ids: dict[str, set] = defaultdict(set)
+    # Each record id is interned to a compact int once; set algebra runs on ints
+    id2int: dict[str, int] = {}
+    q2ids: dict[str, set[int]] = defaultdict(set)
 
     for fp in files:
-        if fp.suffix == ".jsonl":
-            records = read_jsonl(fp)
-        else:
-            records = read_json(fp)
+        # JSONL is streamed, so only one record is held at a time
+        records = read_jsonl(fp) if fp.suffix == ".jsonl" else read_json(fp)
 
         for rec in records:
             rid = extract_id(rec)
             if not rid:
                 continue
             qid = infer_query_id(fp, rec)
-            q2ids[qid].add(rid)
+            q2ids[qid].add(id2int.setdefault(rid, len(id2int)))
 
     return q2ids
 
 
+# Intersection size (set.intersection already walks the smaller set in C)
+def inter_count(set_a: set, set_b: set) -> int:
+    return len(set_a.intersection(set_b))
+
+
+# Divide, with 0.0 where the denominator is 0
+def safe_div(num, den):
+    return np.divide(num, den, out=np.zeros(num.shape, dtype=float), where=den != 0)
+
+
 # Build table with pairwise overlap and Jaccard similarity
-def build_pair_table(q2ids: dict[str, set]):
-    rows = []
+def build_pair_table(q2ids: dict[str, set[int]]):
     qids = sorted(q2ids.keys())
+    n = len(qids)
+    n_pairs = n * (n + 1) // 2
+
+    # Column arrays filled in place instead of one dict per pair
+    idx_a = np.empty(n_pairs, dtype=np.int32)
+    idx_b = np.empty(n_pairs, dtype=np.int32)
+    inter = np.empty(n_pairs, dtype=np.int64)
+    k = 0
     for i, a in enumerate(qids):
-        for b in qids[i:]:
-            set_a = q2ids[a]
-            set_b = q2ids[b]
-            inter = len(set_a & set_b)
-            union = len(set_a | set_b)
-            jacc = inter / union if union else 0.0
-            rows.append(
-                {
-                    "query_a": a,
-                    "size_a": len(set_a),
-                    "query_b": b,
-                    "size_b": len(set_b),
-                    "overlap": inter,
-                    "union": union,
-                    "jaccard": round(jacc, 6),
-                    "overlap_pct_of_a": round(inter / len(set_a), 6)
-                    if set_a
-                    else 0.0,
-                    "overlap_pct_of_b": round(inter / len(set_b), 6)
-                    if set_b
-                    else 0.0,
-                }
-            )
-    return pd.DataFrame(rows)
+        for j in range(i, n):
+            idx_a[k] = i
+            idx_b[k] = j
+            inter[k] = inter_count(q2ids[a], q2ids[qids[j]])
+            k += 1
+
+    sizes = np.array([len(q2ids[q]) for q in qids], dtype=np.int64)
+    size_a = sizes[idx_a]
+    size_b = sizes[idx_b]
+    union = size_a + size_b - inter
+    qarr = np.array(qids, dtype=object)
+
+    return pd.DataFrame(
+        {
+            "query_a": qarr[idx_a],
+            "size_a": size_a,
+            "query_b": qarr[idx_b],
+            "size_b": size_b,
+            "overlap": inter,
+            "union": union,
+            "jaccard": np.round(safe_div(inter, union), 6),
+            "overlap_pct_of_a": np.round(safe_div(inter, size_a), 6),
+            "overlap_pct_of_b": np.round(safe_div(inter, size_b), 6),
+        }
+    )
 
 
 # Create a symmetric overlap matrix
-def build_overlap_matrix(q2ids: dict[str, set]):
+def build_overlap_matrix(q2ids: dict[str, set[int]]):
     qids = sorted(q2ids.keys())
     data = []
     for a in qids:
         row = []
         for b in qids:
-            row.append(len(q2ids[a] & q2ids[b]))
+            row.append(inter_count(q2ids[a], q2ids[b]))
         data.append(row)
     return pd.DataFrame(data, index=qids, columns=qids)
 
 
 # Print the top-N most overlapping query pairs
-def list_top_overlaps(pairs_path: Path, n: int = 10):
-    df = pd.read_csv(pairs_path)
-    df = df[df["query_a"] != df["query_b"]]  # remove identical pairs
-    df_sorted = df.sort_values("jaccard", ascending=False).head(n)
+def list_top_overlaps(pair_df: pd.DataFrame, n: int = 10):
+    df = pair_df[pair_df["query_a"] != pair_df["query_b"]]  # remove identical pairs
+    df_sorted = df.nlargest(n, "jaccard")
     print("\nTop overlapping query pairs:")
     print(df_sorted[["query_a", "query_b", "overlap", "jaccard"]].to_string(index=False))
     return df_sorted
 
 
+# Write a DataFrame to CSV with Arrow's C++ writer
+def write_csv(df: pd.DataFrame, path: Path):
+    pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), path)
+
+
 # Main entry point: load, compute tables, write results
 def main():
     OUT_DIR.mkdir(parents=True, exist_ok=True)
@@ -144,17 +164,19 @@ def main():
     matrix_out = OUT_DIR / "overlap_matrix.csv"
     sizes_out = OUT_DIR / "query_sizes.csv"
 
-    pair_df.to_csv(pair_out, index=False)
-    matrix_df.to_csv(matrix_out)
-    pd.DataFrame(
+    write_csv(pair_df, pair_out)
+    # Index becomes the first, unnamed column, as with DataFrame.to_csv
+    write_csv(matrix_df.reset_index(names=""), matrix_out)
+    sizes_df = pd.DataFrame(
         [{"query_id": q, "n_docs": len(s)} for q, s in sorted(q2ids.items())]
-    ).to_csv(sizes_out, index=False)
+    )
+    write_csv(sizes_df, sizes_out)
 
     print(f"Wrote: {pair_out}")
     print(f"Wrote: {matrix_out}")
     print(f"Wrote: {sizes_out}")
 
-    list_top_overlaps(pair_out)
+    list_top_overlaps(pair_df)
 
 
 if __name__ == "__main__":
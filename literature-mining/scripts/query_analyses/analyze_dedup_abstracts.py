@@ -1,7 +1,10 @@
 import sys
 from pathlib import Path
+import numpy as np
 import pandas as pd
-from collections import defaultdict
+import polars as pl
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import matplotlib.pyplot as plt
 
 # Input/output paths
@@ -15,50 +18,73 @@ def load_query_sets_from_abstracts(csv_path: Path):
         print(f"Missing file: {csv_path}", file=sys.stderr)
         sys.exit(1)
 
-    df = pd.read_csv(csv_path)
-
     need = {"query_id", "doi"}
-    missing = need - set(df.columns)
+    # Lazy scan: only the two needed columns are parsed, multithreaded
+    lf = pl.scan_csv(csv_path, infer_schema=False)
+
+    missing = need - set(lf.collect_schema().names())
     if missing:
         print(f"Missing columns in {csv_path}: {sorted(missing)}", file=sys.stderr)
         sys.exit(1)
 
-    q2ids: dict[str, set] = defaultdict(set)
+    # Normalize DOIs column-wise: lowercase, no resolver prefix
+    doi = (
+        pl.col("doi").str.strip_chars().str.to_lowercase()
+        .str.strip_prefix("https://doi.org/")
+        .str.strip_prefix("http://doi.org/")
+    )
+    grouped = (
+        lf.select(pl.col("query_id"), doi)
+        .drop_nulls()
+        .filter((pl.col("query_id") != "") & (pl.col("doi") != ""))
+        .group_by("query_id")
+        .agg(pl.col("doi").unique())
+        .collect()
+    )
 
-    for _, row in df.iterrows():
-        qid = row["query_id"]
-        doi = row["doi"]
-        if not qid or not doi:
-            continue
-        q2ids[str(qid)].add(str(doi))
+    q2ids: dict[str, set] = {
+        q: set(dois) for q, dois in zip(grouped["query_id"].to_list(), grouped["doi"].to_list())
+    }
 
     return q2ids
 
 
 # Deduplicate across queries: smallest query keeps the DOI
 def dedup_keep_smallest(q2ids: dict[str, set]):
-    # doi -> queries that contain it
-    doi2qs: dict[str, list[str]] = defaultdict(list)
-    for qid, dois in q2ids.items():
-        for doi in dois:
-            doi2qs[doi].append(qid)
+    # Rank queries smallest first (stable tie-break on name); bit r of an id's mask = rank r contains it
+    ranked = sorted(q2ids, key=lambda q: (len(q2ids[q]), q))
+
+    # Intern DOIs to ints so membership can live in NumPy arrays
+    doi2int: dict[str, int] = {}
+    arrs = [
+        np.fromiter((doi2int.setdefault(d, len(doi2int)) for d in q2ids[q]), dtype=np.int64, count=len(q2ids[q]))
+        for q in ranked
+    ]
+    int2doi = np.array(list(doi2int), dtype=object)
+    n_ids = len(int2doi)
+
+    n_words = (len(ranked) + 63) // 64
+    masks = np.zeros((n_words, n_ids), dtype=np.uint64)
+    for r, ids in enumerate(arrs):
+        masks[r // 64, ids] |= np.uint64(1) << np.uint64(r % 64)
+
+    # Keeper = lowest set bit, taken from the first non-empty 64-query word
+    keep_rank = np.full(n_ids, -1, dtype=np.int64)
+    for w in range(n_words):
+        todo = (keep_rank < 0) & (masks[w] != 0)
+        m = masks[w, todo]
+        low = m & (~m + np.uint64(1))
+        keep_rank[todo] = w * 64 + np.bitwise_count(low - np.uint64(1))
+
+    out = {q: set(int2doi[ids[keep_rank[ids] == r]]) for r, (q, ids) in enumerate(zip(ranked, arrs))}
+    removed = sum(len(ids) for ids in arrs) - sum(len(s) for s in out.values())
 
-    out = {q: set(dois) for q, dois in q2ids.items()}
-
-    removed = 0
-    for doi, qs in doi2qs.items():
-        if len(qs) <= 1:
-            continue
-
-        # Keep in smallest group (stable tie-break on name)
-        keep = min(qs, key=lambda q: (len(out[q]), q))
+    return out, removed
 
-        for q in qs:
-            if q != keep and doi in out[q]:
-                out[q].remove(doi)
-                removed += 1
 
-    return out, removed
+# Write a DataFrame to CSV with Arrow's C++ writer
+def write_csv(df: pd.DataFrame, path: Path):
+    pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), path)
 
 
 # Build query sizes df before/after dedup, with totals
@@ -86,7 +112,7 @@ def build_query_sizes_dedup_df(q2ids_raw: dict[str, set], q2ids_dedup: dict[str,
 
 # Save query sizes table to CSV
 def write_query_sizes_dedup(df_sizes: pd.DataFrame, out_path: Path):
-    df_sizes.to_csv(out_path, index=False)
+    write_csv(df_sizes, out_path)
 
 
 # Plot bars: before vs after per query
@@ -1,31 +1,31 @@
 import os
 import sys
-import json
+import orjson
 from pathlib import Path
 from collections import defaultdict
+from itertools import chain
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from numba import njit, prange
 
 # Input/output directories
 RAW_DIR = Path(__file__).resolve().parents[2] / "data" / "short-raw-refs-abs"
 OUT_DIR = Path(__file__).resolve().parents[2] / "reports" / "tables" / "overlap_analysis"
 
 
-# Read a JSONL file -> list of dicts
+# Read a JSONL file -> one dict at a time
 def read_jsonl(p: Path):
-    out = []
-    with p.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            out.append(json.loads(line))
-    return out
+    # Raw bytes: no text decoding or line buffering, orjson reads UTF-8 directly
+    for line in p.read_bytes().splitlines():
+        if line.strip():
+            yield orjson.loads(line)
 
 
 # Read a JSON file -> list with one dict
 def read_json(p: Path):
-    with p.open("r", encoding="utf-8") as f:
-        return [json.load(f)]
+    return [orjson.loads(p.read_bytes())]
 
 
 # Normalize DOI to lowercase without prefix
@@ -49,7 +49,7 @@ def infer_query_id(file_path: Path, rec: dict) -> str:
     return rec.get("query_id") or file_path.parent.name
 
 
-# Load all records recursively under RAW_DIR
+# Load all records recursively under RAW_DIR -> query_id -> set(int id)
 def load_all_records(raw_dir: Path):
     files = sorted(
         [*raw_dir.rglob("*.jsonl"), *raw_dir.rglob("*.json")]
@@ -59,105 +59,139 @@ def load_all_records(raw_dir: Path):
         print(f"No raw files in {raw_dir}", file=sys.stderr)
         sys.exit(1)
 
-    q2ids: dict[str, set] = defaultdict(set)
+    # Each record id is interned to a compact int once; set algebra runs on ints
+    id2int: dict[str, int] = {}
+    q2ids: dict[str, set[int]] = defaultdict(set)
 
     for fp in files:
-        if fp.suffix == ".jsonl":
-            records = read_jsonl(fp)
-        else:
-            records = read_json(fp)
+        # JSONL is streamed, so only one record is held at a time
+        records = read_jsonl(fp) if fp.suffix == ".jsonl" else read_json(fp)
 
         for rec in records:
             rid = extract_id(rec)
             if not rid:
                 continue
             qid = infer_query_id(fp, rec)
-            q2ids[qid].add(rid)
+            q2ids[qid].add(id2int.setdefault(rid, len(id2int)))
 
     return q2ids
 
 
-# Build table with pairwise overlap and Jaccard similarity
-def build_pair_table(q2ids: dict[str, set]):
-    rows = []
-    qids = sorted(q2ids.keys())
-    for i, a in enumerate(qids):
-        for b in qids[i:]:
-            set_a = q2ids[a]
-            set_b = q2ids[b]
-            inter = len(set_a & set_b)
-            union = len(set_a | set_b)
-            jacc = inter / union if union else 0.0
-            rows.append(
-                {
-                    "query_a": a,
-                    "size_a": len(set_a),
-                    "query_b": b,
-                    "size_b": len(set_b),
-                    "overlap": inter,
-                    "union": union,
-                    "jaccard": round(jacc, 6),
-                    "overlap_pct_of_a": round(inter / len(set_a), 6)
-                    if set_a
-                    else 0.0,
-                    "overlap_pct_of_b": round(inter / len(set_b), 6)
-                    if set_b
-                    else 0.0,
-                }
-            )
-    return pd.DataFrame(rows)
-
-
-# Create a symmetric overlap matrix
-def build_overlap_matrix(q2ids: dict[str, set]):
-    qids = sorted(q2ids.keys())
-    data = []
-    for a in qids:
-        row = []
-        for b in qids:
-            row.append(len(q2ids[a] & q2ids[b]))
-        data.append(row)
-    return pd.DataFrame(data, index=qids, columns=qids)
+# Count shared ids of two sorted CSR slices with a linear merge
+@njit(cache=True)
+def _sorted_intersect_count(indices, a0, a1, b0, b1):
+    i, j, n = a0, b0, 0
+    while i < a1 and j < b1:
+        x = indices[i]
+        y = indices[j]
+        if x == y:
+            n += 1
+            i += 1
+            j += 1
+        elif x < y:
+            i += 1
+        else:
+            j += 1
+    return n
+
+
+# Symmetric intersection matrix; rows of the upper triangle run in parallel
+@njit(parallel=True, cache=True)
+def _overlap_matrix(indptr, indices, n_queries):
+    M = np.zeros((n_queries, n_queries), np.int32)
+    for i in prange(n_queries):
+        for j in range(i, n_queries):
+            c = _sorted_intersect_count(indices, indptr[i], indptr[i + 1], indptr[j], indptr[j + 1])
+            M[i, j] = c
+            M[j, i] = c
+    return M
+
+
+# Pairwise intersection counts from a CSR layout: sorted int ids of query q in indices[indptr[q]:indptr[q+1]]
+def overlap_counts(q2ids: dict[str, set[int]], qids: list[str]):
+    sizes = np.array([len(q2ids[q]) for q in qids], dtype=np.int64)
+    indptr = np.zeros(len(qids) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=indptr[1:])
+    indices = np.fromiter(
+        chain.from_iterable(sorted(q2ids[q]) for q in qids),
+        dtype=np.int32,
+        count=int(indptr[-1]),
+    )
+    return _overlap_matrix(indptr, indices, len(qids))
+
+
+# Divide, with 0.0 where the denominator is 0
+def safe_div(num, den):
+    return np.divide(num, den, out=np.zeros(num.shape, dtype=float), where=den != 0)
+
+
+# Build table with pairwise overlap and Jaccard similarity from the overlap counts
+def build_pair_table(qids: list[str], B: np.ndarray):
+    sizes = np.diag(B)
+    C = sizes[:, None] + sizes[None, :] - B
+
+    # Upper triangle incl. diagonal, same order as a nested i <= j loop
+    ia, ib = np.triu_indices(len(qids))
+    inter = B[ia, ib]
+    union = C[ia, ib]
+    qarr = np.array(qids, dtype=object)
+
+    return pd.DataFrame(
+        {
+            "query_a": qarr[ia],
+            "size_a": sizes[ia],
+            "query_b": qarr[ib],
+            "size_b": sizes[ib],
+            "overlap": inter,
+            "union": union,
+            "jaccard": np.round(safe_div(inter, union), 6),
+            "overlap_pct_of_a": np.round(safe_div(inter, sizes[ia]), 6),
+            "overlap_pct_of_b": np.round(safe_div(inter, sizes[ib]), 6),
+        }
+    )
+
+
+# Create a symmetric overlap matrix from the overlap counts
+def build_overlap_matrix(qids: list[str], B: np.ndarray):
+    return pd.DataFrame(B, index=qids, columns=qids)
 
 
 # Print the top-N most overlapping query pairs
-def list_top_overlaps(pairs_path: Path, n: int = 20):
-    df = pd.read_csv(pairs_path)
-    df = df[df["query_a"] != df["query_b"]]  # remove identical pairs
-    df_sorted = df.sort_values("jaccard", ascending=False).head(n)
+def list_top_overlaps(pair_df: pd.DataFrame, n: int = 20):
+    df = pair_df[pair_df["query_a"] != pair_df["query_b"]]  # remove identical pairs
+    df_sorted = df.nlargest(n, "jaccard")
     print("\nTop overlapping query pairs:")
     print(df_sorted[["query_a", "query_b", "overlap", "overlap_pct_of_b", "jaccard"]].to_string(index=False))
     return df_sorted
 
 # Deduplicate across queries: smallest query keeps the record id
-def dedup_keep_smallest(q2ids: dict[str, set]):
-    # rid -> queries that contain it
-    rid2qs: dict[str, list[str]] = defaultdict(list)
-    for qid, ids in q2ids.items():
-        for rid in ids:
-            rid2qs[rid].append(qid)
-
-    out = {q: set(ids) for q, ids in q2ids.items()}
-
-    removed = 0
-    for rid, qs in rid2qs.items():
-        if len(qs) <= 1:
-            continue
-
-        # Keep in smallest group (stable tie-break on name)
-        keep = min(qs, key=lambda q: (len(out[q]), q))
-
-        for q in qs:
-            if q != keep and rid in out[q]:
-                out[q].remove(rid)
-                removed += 1
+def dedup_keep_smallest(q2ids: dict[str, set[int]]):
+    # Rank queries smallest first (stable tie-break on name); bit r of an id's mask = rank r contains it
+    ranked = sorted(q2ids, key=lambda q: (len(q2ids[q]), q))
+    arrs = [np.fromiter(q2ids[q], dtype=np.int64, count=len(q2ids[q])) for q in ranked]
+    n_ids = 1 + max((int(a.max()) for a in arrs if a.size), default=-1)
+    n_words = (len(ranked) + 63) // 64
+    masks = np.zeros((n_words, n_ids), dtype=np.uint64)
+    for r, ids in enumerate(arrs):
+        masks[r // 64, ids] |= np.uint64(1) << np.uint64(r % 64)
+
+    # Keeper = lowest set bit, taken from the first non-empty 64-query word
+    keep_rank = np.full(n_ids, -1, dtype=np.int64)
+    for w in range(n_words):
+        todo = (keep_rank < 0) & (masks[w] != 0)
+        m = masks[w, todo]
+        low = m & (~m + np.uint64(1))
+        keep_rank[todo] = w * 64 + np.bitwise_count(low - np.uint64(1))
+
+    out = {q: set(ids[keep_rank[ids] == r].tolist()) for r, (q, ids) in enumerate(zip(ranked, arrs))}
+    removed = sum(len(ids) for ids in arrs) - sum(len(s) for s in out.values())
 
     return out, removed
 
 # Write query sizes before/after dedup, with totals
 def write_query_sizes_dedup(
-    q2ids_raw: dict[str, set],
-    q2ids_dedup: dict[str, set],
+    q2ids_raw: dict[str, set[int]],
+    q2ids_dedup: dict[str, set[int]],
     out_path: Path,
 ):
     rows = []
@@ -179,7 +213,12 @@ def write_query_sizes_dedup(
         }
     )
 
-    pd.DataFrame(rows).to_csv(out_path, index=False)
+    write_csv(pd.DataFrame(rows), out_path)
+
+
+# Write a DataFrame to CSV with Arrow's C++ writer
+def write_csv(df: pd.DataFrame, path: Path):
+    pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), path)
 
 
 # Main entry point: load, compute tables, write results
@@ -187,18 +226,23 @@ def main():
     OUT_DIR.mkdir(parents=True, exist_ok=True)
 
     q2ids = load_all_records(RAW_DIR)
-    pair_df = build_pair_table(q2ids)
-    matrix_df = build_overlap_matrix(q2ids)
+    # Pairwise counts computed once, shared by both tables
+    qids = sorted(q2ids.keys())
+    B = overlap_counts(q2ids, qids)
+    pair_df = build_pair_table(qids, B)
+    matrix_df = build_overlap_matrix(qids, B)
 
     pair_out = OUT_DIR / "overlap_pairs.csv"
     matrix_out = OUT_DIR / "overlap_matrix.csv"
     sizes_out = OUT_DIR / "query_sizes.csv"
 
-    pair_df.to_csv(pair_out, index=False)
-    matrix_df.to_csv(matrix_out)
-    pd.DataFrame(
+    write_csv(pair_df, pair_out)
+    # Index becomes the first, unnamed column, as with DataFrame.to_csv
+    write_csv(matrix_df.reset_index(names=""), matrix_out)
+    sizes_df = pd.DataFrame(
         [{"query_id": q, "n_docs": len(s)} for q, s in sorted(q2ids.items())]
-    ).to_csv(sizes_out, index=False)
+    )
+    write_csv(sizes_df, sizes_out)
 
     print(f"Wrote: {pair_out}")
     print(f"Wrote: {matrix_out}")
@@ -212,7 +256,7 @@ def main():
     print(f"Wrote: {sizes_dedup_out}")
     print(f"Dedup removals: {removed}")
 
-    list_top_overlaps(pair_out)
+    list_top_overlaps(pair_df)
 
 
 if __name__ == "__main__":
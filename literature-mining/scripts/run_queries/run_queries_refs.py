@@ -3,20 +3,40 @@
 
 import os
 import sys
-import json
+import queue
+import threading
+import orjson
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from functools import partial
 from pathlib import Path
 
 from dotenv import load_dotenv
 import yaml
+from diskcache import Cache
 from tqdm import tqdm
 from pybliometrics.scopus import ScopusSearch, AbstractRetrieval
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
+from pybliometrics.exception import Scopus429Error, ScopusServerError
+from requests.exceptions import ConnectionError as RequestsConnectionError, RetryError, Timeout
+
+
+# Set FORCE_REFRESH=1 to ignore cached retrievals (fresh results are still stored)
+FORCE_REFRESH = os.getenv("FORCE_REFRESH", "0") == "1"
+
+# ScopusSearch fields kept per record (analyses read eid, doi and title)
+SEARCH_FIELDS = ("eid", "doi", "title", "coverDate", "publicationName", "citedby_count")
+
+# Throttling, server errors and dropped connections are worth retrying; anything else (e.g. 404) is not
+# (pybliometrics surfaces 5xx responses as RetryError once its own urllib3 retries are used up)
+RETRYABLE_ERRORS = (Scopus429Error, ScopusServerError, RetryError, RequestsConnectionError, Timeout)
 
 
 def load_queries(yaml_path: Path):
-    # Load YAML queries
+    # Load YAML queries (C loader from libyaml when PyYAML was built with it)
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
     with yaml_path.open("r", encoding="utf-8") as f:
-        data = yaml.safe_load(f) or {}
+        data = yaml.load(f, Loader=loader) or {}
     return data.get("queries", [])
 
 
@@ -37,30 +57,93 @@ def init_pybliometrics():
 
 
 def write_jsonl(records, out_path: Path):
-    # Write JSONL
-    with out_path.open("w", encoding="utf-8") as f:
+    # Write JSONL as records arrive (records can be a generator); returns the count
+    n_written = 0
+    # orjson emits UTF-8 bytes with the newline appended, so the file is binary
+    with out_path.open("wb", buffering=1 << 20) as f:
         for r in records:
-            f.write(json.dumps(r, ensure_ascii=False) + "\n")
-
-
-def fetch_refs_for_eid(eid: str, retries: int):
-    # Fetch REF view for one EID
-    for _ in range(retries):
-        try:
-            doc = AbstractRetrieval(eid, view="REF")
-            refs = doc.references or []
-            return [
-                {
-                    "doi": getattr(r, "doi", None),
-                    "title": getattr(r, "title", None),
-                    "id": getattr(r, "id", None),
-                    "sourcetitle": getattr(r, "sourcetitle", None),
-                }
-                for r in refs
-            ]
-        except Exception:
-            continue
-    return []
+            f.write(orjson.dumps(r, option=orjson.OPT_APPEND_NEWLINE))
+            n_written += 1
+    return n_written
+
+
+def retrieve(eid: str, view: str, retries: int, **kwargs):
+    # AbstractRetrieval with jittered exponential backoff between attempts
+    retrying = retry(
+        stop=stop_after_attempt(retries),
+        wait=wait_exponential_jitter(initial=0.5, max=10),
+        retry=retry_if_exception_type(RETRYABLE_ERRORS),
+        reraise=True,
+    )
+    return retrying(AbstractRetrieval)(eid, view=view, **kwargs)
+
+
+def fetch_refs_for_eid(eid: str | None, retries: int, cache: Cache):
+    # Fetch REF view for one EID (cached on disk); safe to run in threads
+    if not eid:
+        return []
+    key = f"{eid}:REF"
+    if not FORCE_REFRESH and key in cache:
+        return cache[key]
+    try:
+        doc = retrieve(eid, "REF", retries)
+        refs = doc.references or []
+        ref_docs = [
+            {
+                "doi": getattr(r, "doi", None),
+                "title": getattr(r, "title", None),
+                "id": getattr(r, "id", None),
+                "sourcetitle": getattr(r, "sourcetitle", None),
+            }
+            for r in refs
+        ]
+        cache[key] = ref_docs
+        return ref_docs
+    except Exception:
+        # Retries used up, or an error not worth retrying
+        return []
+
+
+def cached_result(eid: str | None, cache: Cache):
+    # Read a prefetched result back from the cache (defaults if the fetch failed)
+    if not eid:
+        return {"ref_docs": []}
+    return {"ref_docs": cache.get(f"{eid}:REF", [])}
+
+
+def prefetch(eids, retries: int, workers: int, cache: Cache):
+    # Fetch each EID once, in a thread pool; results are stored in the cache
+    # Progress bar redraws at most once a second, not after every request
+    fetch = partial(fetch_refs_for_eid, retries=retries, cache=cache)
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        for _ in tqdm(ex.map(fetch, eids), total=len(eids), desc="fetch",
+                      mininterval=1.0, miniters=100, dynamic_ncols=True):
+            pass
+
+
+def search_queries(queries, searched: queue.Queue):
+    # Producer: run the searches in order and hand each result list over; None marks the end
+    try:
+        for q in queries:
+            try:
+                s = ScopusSearch(q["query"], view="STANDARD")
+            except Exception as e:
+                print(f"{q['id']}: error: {e}", file=sys.stderr)
+                continue
+            searched.put((q, s.results or []))
+    finally:
+        # Always unblock the consumer, even if a search fails unexpectedly
+        searched.put(None)
+
+
+def iter_records(results, qid: str, run_ts: str, cache: Cache):
+    # Build one record per document from the cache, yielded for streaming writes
+    for doc in results:
+        d = {field: getattr(doc, field, None) for field in SEARCH_FIELDS}
+        d["query_id"] = qid
+        d["retrieved_at"] = run_ts
+        d.update(cached_result(d.get("eid"), cache))
+        yield d
 
 
 def main():
@@ -78,12 +161,35 @@ def main():
         sys.exit(1)
 
     ref_retries = int(os.getenv("REF_RETRIES", "3"))
+    workers = int(os.getenv("FETCH_WORKERS", "16"))
+    # All queries by default; set QUERY_LIMIT=N to run only the first N when testing
+    query_limit = os.getenv("QUERY_LIMIT")
+    if query_limit:
+        queries = queries[:int(query_limit)]
     run_ts = datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
     summary = []
 
-    # Testing for different queries
-    # Change from 'queries[...]' to 'queries' later
-    for q in queries[2:3]: 
+    # (EID, view) -> parsed result, shared by all queries and kept between runs
+    # Records are read back from here, so nothing may be evicted (no size limit)
+    cache = Cache(str(project_root / ".scopus_cache"), eviction_policy="none")
+
+    # Searches run in a background thread, so paging the next query overlaps fetching this one
+    # At most one finished search waits in the queue, so only query q+1 runs ahead
+    searched = queue.Queue(maxsize=1)
+    producer = threading.Thread(target=search_queries, args=(queries, searched), daemon=True)
+    producer.start()
+
+    # EIDs fetched for an earlier query are not fetched again (queries overlap)
+    seen = set()
+    while (item := searched.get()) is not None:
+        q, results = item
+
+        # Fetch this query's new EIDs once, in parallel
+        new_eids = sorted({doc.eid for doc in results if doc.eid} - seen)
+        seen.update(new_eids)
+        prefetch(new_eids, ref_retries, workers, cache)
+
+        # Write per-query records; streamed, not kept in memory
         qid = q["id"]
         qstr = q["query"]
 
@@ -94,41 +200,29 @@ def main():
         meta_file = q_out_dir / f"{qid}_meta.json"
 
         try:
-            s = ScopusSearch(qstr, view="STANDARD")
-            results = s.results or []
-            records = []
-
-            for doc in tqdm(results, desc=f"{qid}"):
-                d = doc._asdict()
-                d["query_id"] = qid
-                d["retrieved_at"] = run_ts
-
-                eid = d.get("eid")
-                d["ref_docs"] = fetch_refs_for_eid(eid, retries=ref_retries) if eid else []
-
-                records.append(d)
-
-            write_jsonl(records, out_file)
+            n_records = write_jsonl(iter_records(results, qid, run_ts, cache), out_file)
 
             meta = {
                 "query_id": qid,
                 "query": qstr,
-                "n_returned": len(records),
-                "refs_attempted": len(records),
+                "n_returned": n_records,
+                "refs_attempted": n_records,
                 "retrieved_at": run_ts,
                 "fetch_refs": True,
             }
-            meta_file.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
-            print(f"{qid}: {len(records)} results, refs for all attempted")
+            meta_file.write_bytes(orjson.dumps(meta, option=orjson.OPT_INDENT_2))
+            print(f"{qid}: {n_records} results, refs for all attempted")
 
             summary.append(meta)
 
         except Exception as e:
             print(f"{qid}: error: {e}", file=sys.stderr)
 
-    (base_out_dir / "_run_summary.json").write_text(
-        json.dumps({"run_at": run_ts, "queries": summary}, ensure_ascii=False, indent=2),
-        encoding="utf-8",
+    producer.join()
+    cache.close()
+
+    (base_out_dir / "_run_summary.json").write_bytes(
+        orjson.dumps({"run_at": run_ts, "queries": summary}, option=orjson.OPT_INDENT_2)
     )
 
 
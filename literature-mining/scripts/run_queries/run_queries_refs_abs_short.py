@@ -4,19 +4,35 @@
 
 import os
 import sys
-import json
+import queue
+import threading
+import orjson
+import time
+import random
+import asyncio
 from datetime import datetime, timezone
 from pathlib import Path
 from dotenv import load_dotenv
 import yaml
+import aiohttp
+from diskcache import Cache
 from tqdm import tqdm
-from pybliometrics.scopus import ScopusSearch, AbstractRetrieval
+from pybliometrics.scopus import ScopusSearch
+
+# Scopus Abstract Retrieval endpoint, queried directly for concurrent fetches
+ABSTRACT_URL = "https://api.elsevier.com/content/abstract/eid/{eid}"
+MAX_CONCURRENCY = 64  # open requests per host
+CHUNK_SIZE = 1024  # EIDs gathered per round
+BATCH_SIZE = 1000  # records buffered before each write
+RATE_LIMIT = float(os.getenv("SCOPUS_RATE", "9"))  # requests per second (Abstract Retrieval throttle)
+FORCE_REFRESH = os.getenv("FORCE_REFRESH", "0") == "1"  # ignore cached retrievals, still store fresh ones
 
 
 def load_queries(yaml_path: Path):
-    # Load YAML queries
+    # Load YAML queries (C loader from libyaml when PyYAML was built with it)
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
     with yaml_path.open("r", encoding="utf-8") as f:
-        data = yaml.safe_load(f) or {}
+        data = yaml.load(f, Loader=loader) or {}
     return data.get("queries", [])
 
 
@@ -38,23 +54,227 @@ def init_pybliometrics():
     pybliometrics.scopus.init(keys=[api_key])
 
 
-def write_jsonl(records, out_path: Path):
-    # Write JSONL
-    with out_path.open("w", encoding="utf-8") as f:
-        for r in records:
-            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+def as_list(value):
+    # Scopus JSON gives a dict for single items and a list otherwise
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def parse_ref(ref: dict):
+    # Pick DOI and title from one reference entry
+    info = ref.get("ref-info") or {}
+    doi = None
+    for item in as_list((info.get("refd-itemidlist") or {}).get("itemid")):
+        if isinstance(item, dict) and item.get("@idtype") == "DOI":
+            doi = item.get("$")
+            break
+    title = (info.get("ref-title") or {}).get("ref-titletext")
+    return {"doi": doi, "title": title}
+
+
+def parse_full(data: dict):
+    # Extract abstract and references from a FULL view response
+    resp = data.get("abstracts-retrieval-response") or {}
+    bibrecord = (resp.get("item") or {}).get("bibrecord") or {}
+    abstract = (bibrecord.get("head") or {}).get("abstracts") or (resp.get("coredata") or {}).get("dc:description")
+    refs = ((bibrecord.get("tail") or {}).get("bibliography") or {}).get("reference")
+    return {
+        "abstract": abstract,
+        "ref_docs": [parse_ref(r) for r in as_list(refs) if isinstance(r, dict)],
+    }
+
+
+class AsyncRateLimiter:
+    # Token bucket shared by all fetch tasks, adjusted by Scopus rate-limit headers
+    # paused_until/remaining seed the state left by an earlier limiter (previous query)
+    def __init__(self, refill_rate: float, capacity: int | None = None,
+                 paused_until: float = 0.0, remaining: int | None = None):
+        self.refill_rate = refill_rate
+        self.capacity = capacity or max(1, int(refill_rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = paused_until
+        self.remaining = remaining
+        if remaining is not None:
+            if remaining <= 0:
+                self.tokens = 0.0
+            elif remaining < self.capacity:
+                self.capacity = remaining
+                self.tokens = float(remaining)
+        self.cond = asyncio.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+        self.updated = now
 
+    async def acquire(self):
+        # Block until a token is free (or the quota has reset)
+        async with self.cond:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    delay = self.paused_until - now
+                else:
+                    self._refill()
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    delay = (1 - self.tokens) / self.refill_rate
+                try:
+                    await asyncio.wait_for(self.cond.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def update(self, remaining: int, reset_ts: float):
+        # Never hold more tokens than quota left; pause until reset when it runs out
+        async with self.cond:
+            self.remaining = remaining
+            if remaining <= 0:
+                self.tokens = 0.0
+                self.paused_until = time.monotonic() + max(reset_ts - time.time(), 1.0)
+            elif remaining < self.capacity:
+                self.capacity = remaining
+                self.tokens = min(self.tokens, remaining)
+            self.cond.notify_all()
+
+
+def parse_rate_limit(headers):
+    # X-RateLimit-Remaining / X-RateLimit-Reset (epoch seconds), if present
+    try:
+        remaining = int(headers["X-RateLimit-Remaining"])
+        reset_ts = float(headers.get("X-RateLimit-Reset", 0))
+    except (KeyError, ValueError):
+        return None
+    return remaining, reset_ts
 
-def fetch_full_for_eid(eid: str, retries: int):
+
+async def fetch_eid(session: aiohttp.ClientSession, eid: str, sem: asyncio.Semaphore,
+                    limiter: AsyncRateLimiter, retries: int):
     # Get references and abstract in one call
-    for _ in range(retries):
-        try:
-            return AbstractRetrieval(eid, id_type="eid", view="FULL")
-        except Exception:
-            continue
+    url = ABSTRACT_URL.format(eid=eid)
+    async with sem:
+        for attempt in range(retries):
+            await limiter.acquire()
+            try:
+                async with session.get(url, params={"view": "FULL"}) as resp:
+                    rate = parse_rate_limit(resp.headers)
+                    if rate:
+                        await limiter.update(*rate)
+                    # Retry only on throttling and server errors
+                    if resp.status != 429 and resp.status < 500:
+                        if resp.status >= 400:
+                            return None
+                        return parse_full(await resp.json())
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                pass
+            # Exponential backoff with jitter; no wait after the last attempt
+            if attempt == retries - 1:
+                break
+            await asyncio.sleep(min(2 ** attempt, 60) + random.random())
     return None
 
 
+async def fetch_record(session, doc, sem, limiter, cache: Cache, qid: str, run_ts: str, retries: int):
+    # Collect minimal metadata, then enrich with abstract and references
+    eid = getattr(doc, "eid", None)
+    d = {
+        "eid": eid,
+        "doi": getattr(doc, "doi", None),
+        "title": getattr(doc, "title", None),
+        "query_id": qid,
+        "retrieved_at": run_ts,
+    }
+
+    # Reuse earlier retrievals; only successful fetches are cached
+    full = cache.get(eid) if eid and not FORCE_REFRESH else None
+    if eid and full is None:
+        full = await fetch_eid(session, eid, sem, limiter, retries)
+        if full is not None:
+            cache[eid] = full
+    d["abstract"] = full["abstract"] if full else None
+    d["ref_docs"] = full["ref_docs"] if full else []
+    return d
+
+
+def flush_jsonl(f, buffer: list):
+    # Write buffered records in one call (orjson emits UTF-8 bytes, file is binary)
+    if buffer:
+        f.write(b"\n".join(orjson.dumps(r) for r in buffer) + b"\n")
+    buffer.clear()
+
+
+async def write_jsonl(out_q: asyncio.Queue, out_path: Path, total: int, desc: str):
+    # Single writer, so file writes stay sequential; None marks the end
+    # 1 MB file buffer, no per-batch flush: the OS coalesces writeback
+    # Progress bar redraws at most once a second, not after every record
+    n_written = 0
+    buffer = []
+    with out_path.open("wb", buffering=1 << 20) as f, tqdm(
+        total=total, desc=desc, mininterval=1.0, miniters=100, dynamic_ncols=True
+    ) as pbar:
+        while True:
+            r = await out_q.get()
+            if r is None:
+                break
+            buffer.append(r)
+            n_written += 1
+            pbar.update(1)
+            if len(buffer) >= BATCH_SIZE:
+                flush_jsonl(f, buffer)
+        flush_jsonl(f, buffer)
+    return n_written
+
+
+async def fetch_query(results, qid: str, run_ts: str, out_file: Path, cache: Cache, retries: int,
+                      rate_state: dict):
+    # Fetch all documents of one query concurrently and stream them to JSONL
+    # rate_state carries the quota pause and remaining count over to the next query
+    headers = {
+        "X-ELS-APIKey": os.environ["PYBLIOMETRICS_API_KEY"],
+        "Accept": "application/json",
+    }
+    sem = asyncio.Semaphore(MAX_CONCURRENCY)
+    limiter = AsyncRateLimiter(RATE_LIMIT, **rate_state)
+    out_q: asyncio.Queue = asyncio.Queue()
+    connector = aiohttp.TCPConnector(limit_per_host=MAX_CONCURRENCY, keepalive_timeout=60)
+    timeout = aiohttp.ClientTimeout(total=120)
+
+    try:
+        async with aiohttp.ClientSession(connector=connector, headers=headers, timeout=timeout) as session:
+            writer = asyncio.create_task(write_jsonl(out_q, out_file, total=len(results), desc=qid))
+            for start in range(0, len(results), CHUNK_SIZE):
+                chunk = results[start:start + CHUNK_SIZE]
+                records = await asyncio.gather(
+                    *(fetch_record(session, doc, sem, limiter, cache, qid, run_ts, retries) for doc in chunk)
+                )
+                # gather keeps input order, so records are written in search-result order
+                for d in records:
+                    await out_q.put(d)
+            await out_q.put(None)
+            n_written = await writer
+    finally:
+        rate_state.update(paused_until=limiter.paused_until, remaining=limiter.remaining)
+    print(f"[{qid}] Quota check: {limiter.remaining} retrievals left")
+    return n_written
+
+
+def search_queries(queries, searched: queue.Queue):
+    # Producer: run the searches in order and hand each search over; None marks the end
+    try:
+        for q in queries:
+            try:
+                s = ScopusSearch(q["query"], view="STANDARD")
+            except Exception as e:
+                print(f"{q['id']}: error: {e}", file=sys.stderr)
+                continue
+            searched.put((q, s))
+    finally:
+        # Always unblock the consumer, even if a search fails unexpectedly
+        searched.put(None)
+
+
 def main():
     script_dir = Path(__file__).resolve().parent
     project_root = script_dir.parents[1]
@@ -73,8 +293,20 @@ def main():
     run_ts = datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
     summary = []
 
+    # EID -> {"abstract", "ref_docs"}, kept between runs
+    cache = Cache(str(project_root / ".abstract_cache"))
+    # Rate-limit state kept across queries, so an exhausted quota still pauses the next one
+    rate_state = {"paused_until": 0.0, "remaining": None}
+
+    # Searches run in a background thread, so paging the next query overlaps fetching this one
+    # At most one finished search waits in the queue, so only query q+1 runs ahead
+    searched = queue.Queue(maxsize=1)
     # Use all queries, narrow with slicing if testing
-    for q in queries:
+    producer = threading.Thread(target=search_queries, args=(queries, searched), daemon=True)
+    producer.start()
+
+    while (item := searched.get()) is not None:
+        q, s = item
         qid = q["id"]
         qstr = q["query"]
 
@@ -85,70 +317,35 @@ def main():
         meta_file = q_out_dir / f"{qid}_meta.json"
 
         try:
-            s = ScopusSearch(qstr, view="STANDARD")
             results = s.results or []
-            records = []
-
-            for i, doc in enumerate(tqdm(results, desc=f"{qid}")):
-                # Collect minimal metadata
-                eid = getattr(doc, "eid", None)
-                d = {
-                    "eid": eid,
-                    "doi": getattr(doc, "doi", None),
-                    "title": getattr(doc, "title", None),
-                    "query_id": qid,
-                    "retrieved_at": run_ts,
-                }
-
-                if eid:
-                    # Get both abstract and references in one retrieval call
-                    full_doc = fetch_full_for_eid(eid, retries=retries)
-                    if full_doc:
-                        d["abstract"] = getattr(full_doc, "abstract", None) or getattr(full_doc, "description", None)
-                        refs = full_doc.references or []
-                        d["ref_docs"] = [
-                            {
-                                "doi": getattr(r, "doi", None),
-                                "title": getattr(r, "title", None),
-                            }
-                            for r in refs
-                        ]
-                    else:
-                        d["ref_docs"] = []
-                        d["abstract"] = None
-                else:
-                    d["ref_docs"] = []
-                    d["abstract"] = None
-                    
-                if i % 500 == 0 and full_doc:
-                    print(f"Quota check ({i} docs): {full_doc.get_key_remaining_quota()} retrievals left")
-                    print(f"[{qid}] SEARCH quota resets at:", s.get_key_reset_time())
-
-                records.append(d)
 
-            write_jsonl(records, out_file)
+            # Get both abstract and references per EID, many requests in flight
+            n_records = asyncio.run(fetch_query(results, qid, run_ts, out_file, cache, retries, rate_state))
+            print(f"[{qid}] SEARCH quota resets at:", s.get_key_reset_time())
 
             meta = {
                 "query_id": qid,
                 "query": qstr,
-                "n_returned": len(records),
-                "refs_attempted": len(records),
-                "abstracts_attempted": len(records),
+                "n_returned": n_records,
+                "refs_attempted": n_records,
+                "abstracts_attempted": n_records,
                 "retrieved_at": run_ts,
                 "fetch_refs": True,
                 "fetch_abstracts": True,
             }
-            meta_file.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
-            print(f"{qid}: {len(records)} results, refs+abstracts attempted for all")
+            meta_file.write_bytes(orjson.dumps(meta, option=orjson.OPT_INDENT_2))
+            print(f"{qid}: {n_records} results, refs+abstracts attempted for all")
 
             summary.append(meta)
 
         except Exception as e:
             print(f"{qid}: error: {e}", file=sys.stderr)
 
-    (base_out_dir / "_run_summary.json").write_text(
-        json.dumps({"run_at": run_ts, "queries": summary}, ensure_ascii=False, indent=2),
-        encoding="utf-8",
+    producer.join()
+    cache.close()
+
+    (base_out_dir / "_run_summary.json").write_bytes(
+        orjson.dumps({"run_at": run_ts, "queries": summary}, option=orjson.OPT_INDENT_2)
     )
 
 
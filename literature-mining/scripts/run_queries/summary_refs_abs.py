@@ -9,15 +9,25 @@ For each subfolder:
 Also creates an overall summary CSV at the root.
 """
 
+import os
+import mmap
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 import pandas as pd
-import json
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import orjson
 
 # SETTINGS
 ROOT_PATH = Path(__file__).resolve().parents[2] / "data" / "short-raw-refs-abs"  # set main path here
 TOP_N = 10  # how many top references to list per folder
 
+# Write a DataFrame to CSV with Arrow's C++ writer
+def write_csv(df: pd.DataFrame, path: Path):
+    pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), path)
+
 # Basic normalization helpers
 def norm_doi(value):
     if not value:
@@ -61,6 +71,26 @@ def extract_abstract(rec) -> str:
         return ""
     return str(val).strip()
 
+# JSONL reader: memory-mapped, so pages are loaded lazily instead of the whole file
+def iter_jsonl(file: Path):
+    if file.stat().st_size == 0:
+        return
+    with file.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        size = len(mm)
+        while start < size:
+            nl = mm.find(b"\n", start)
+            if nl == -1:
+                nl = size
+            line = mm[start:nl].strip()
+            start = nl + 1
+            if not line:
+                continue
+            try:
+                yield orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue
+
 # Folder processing
 def analyze_folder(folder: Path, top_n: int = 10):
     jsonl_files = sorted(folder.glob("*.jsonl"))
@@ -76,33 +106,22 @@ def analyze_folder(folder: Path, top_n: int = 10):
     ref_counts = Counter()
 
     for file in jsonl_files:
-        with file.open("r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    rec = json.loads(line)
-                except json.JSONDecodeError:
-                    continue
-
-                n_records += 1
-
-                # Abstract:
-                abs_txt = extract_abstract(rec)
-                if not abs_txt:
-                    n_empty_abs += 1
-
-                # References
-                refs = rec.get("ref_docs")
-                if not refs:
-                    n_empty_refs += 1
-                    continue
-
-                total_refs += len(refs)
-                for r in refs:
-                    if isinstance(r, dict):
-                        ref_counts[ref_key(r)] += 1
+        for rec in iter_jsonl(file):
+            n_records += 1
+
+            # Abstract:
+            abs_txt = extract_abstract(rec)
+            if not abs_txt:
+                n_empty_abs += 1
+
+            # References
+            refs = rec.get("ref_docs")
+            if not refs:
+                n_empty_refs += 1
+                continue
+
+            total_refs += len(refs)
+            ref_counts.update(ref_key(r) for r in refs if isinstance(r, dict))
 
     # Summary
     summary_lines = [
@@ -131,7 +150,7 @@ def analyze_folder(folder: Path, top_n: int = 10):
         [{"doi": k[0], "title": k[1], "refid": k[2], "count": c} for k, c in ref_counts.items()]
     )
     counts_df = counts_df.sort_values("count", ascending=False)
-    counts_df.to_csv(folder / "_reference_counts.csv", index=False)
+    write_csv(counts_df, folder / "_reference_counts.csv")
 
     print(f"\nAnalyzed: {folder.name}")
     print(f"  Records: {n_records}")
@@ -161,16 +180,15 @@ def main():
         print("No subfolders found.")
         return
 
-    results = []
-    for sub in subfolders:
-        res = analyze_folder(sub, top_n=TOP_N)
-        if res:
-            results.append(res)
+    # Folders are independent (own counts, own output files), one process each
+    workers = min(os.cpu_count() or 1, len(subfolders))
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        results = [res for res in ex.map(partial(analyze_folder, top_n=TOP_N), subfolders) if res]
 
     if results:
         df = pd.DataFrame(results)
         out_path = ROOT_PATH / "_overall_folder_summary.csv"
-        df.to_csv(out_path, index=False)
+        write_csv(df, out_path)
         print(f"\nSaved overall summary → {out_path}")
 
 if __name__ == "__main__":
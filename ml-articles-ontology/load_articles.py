@@ -1,60 +1,107 @@
-import pandas as pd
+import ast
 import re
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 
 GRAPHDB_UPDATE = "http://127.0.0.1:7200/repositories/ML-Ontology/statements"
 BASE = "http://example.com/ml-articles/"
+PREFIX = "@prefix mla: <http://example.com/ml-articles/> .\n"
 
-def sanitize(text):
-    text = text.replace("/", "_")
-    text = re.sub(r"[^A-Za-z0-9_]", "_", text)
-    return text
+BATCH = 1_000  # articles per POST, roughly 10k statements
 
-df = pd.read_csv("ml_articles_dataset.csv")
+PHASE_LABELS = {1: "Planning", 2: "Development_Production", 3: "Optimization", 4: "Use_Reuse"}
 
-triples = []
+# Constant URIs used in every article/method block
+ARTICLE_CLASS = f"<{BASE}Article>"
+METHOD_CLASS = f"<{BASE}Method>"
+HAS_PHASE = f"<{BASE}hasPhase>"
+HAS_PARADIGM = f"<{BASE}hasParadigm>"
+HAS_CLUSTER = f"<{BASE}hasCluster>"
+MENTIONS_METHOD = f"<{BASE}mentionsMethod>"
+SCHEMA_DOI = "<https://schema.org/doi>"
+DCT_TITLE = "<http://purl.org/dc/terms/title>"
+RDFS_LABEL = "<http://www.w3.org/2000/01/rdf-schema#label>"
 
-for _, row in df.iterrows():
-    doi = row["doi"]
-    title = row["title"]
-    phase = int(row["phase"])
-    paradigm = row["ml_category"].strip().lower()
-    cluster = int(row["prod_category"])
-    methods = eval(row["ml_methods"]) if isinstance(row["ml_methods"], str) else []
+# Compiled once and reused for every column passed to sanitize()
+SANITIZE_RE = re.compile(r"[^A-Za-z0-9_]")
 
-    article_uri = BASE + "doi_" + sanitize(doi)
+def sanitize(text: pd.Series) -> pd.Series:
+    # Column-wise: "/" and any other character outside [A-Za-z0-9_] becomes "_"
+    return text.str.replace(SANITIZE_RE, "_", regex=True)
 
-    title_escaped = title.replace('"', '\\"')
-
-    triples.append(f"""
-    <{article_uri}>
-    a <{BASE}Article> ;
-    <https://schema.org/doi> "{doi}" ;
-    <http://purl.org/dc/terms/title> "{title_escaped}" ;
-    <{BASE}hasPhase> <{BASE}Phase{phase}_{"Planning" if phase==1 else "Development_Production" if phase==2 else "Optimization" if phase==3 else "Use_Reuse"}> ;
-    <{BASE}hasParadigm> <{BASE}{paradigm.capitalize()}> ;
-    <{BASE}hasCluster> <{BASE}Cluster{cluster}> .
-    """)
+# Only the columns used below; integer codes parsed once as nullable ints
+df = pd.read_csv(
+    "ml_articles_dataset.csv",
+    usecols=["doi", "title", "phase", "ml_category", "prod_category", "ml_methods"],
+    dtype={"phase": "Int32", "prod_category": "Int32", "ml_category": "string"},
+)
 
+# Article blocks, built column-wise for all rows at once
+doi = df["doi"]
+phase = df["phase"]
+article_uri = "<" + BASE + "doi_" + sanitize(doi) + ">"
+title_escaped = df["title"].str.replace('"', '\\"', regex=False)
+phase_uri = "<" + BASE + "Phase" + phase.astype(str) + "_" + phase.map(PHASE_LABELS) + ">"
+paradigm_uri = "<" + BASE + df["ml_category"].str.strip().str.lower().str.capitalize() + ">"
+cluster_uri = "<" + BASE + "Cluster" + df["prod_category"].astype(str) + ">"
 
-    for m in methods:
-        m_clean = sanitize(m)
-        method_uri = BASE + "Method_" + m_clean
-        triples.append(f"<{article_uri}> <{BASE}mentionsMethod> <{method_uri}> .")
-        triples.append(f"<{method_uri}> a <{BASE}Method> ; <http://www.w3.org/2000/01/rdf-schema#label> \"{m}\" .")
+article_blocks = (
+    "\n    " + article_uri
+    + "\n    a " + ARTICLE_CLASS + " ;"
+    + "\n    " + SCHEMA_DOI + ' "' + doi + '" ;'
+    + "\n    " + DCT_TITLE + ' "' + title_escaped + '" ;'
+    + "\n    " + HAS_PHASE + " " + phase_uri + " ;"
+    + "\n    " + HAS_PARADIGM + " " + paradigm_uri + " ;"
+    + "\n    " + HAS_CLUSTER + " " + cluster_uri + " ."
+    + "\n    "
+)
 
-    # triples.append(".")
+# Method triples: one row per (article, method), keeping the article's index
+# ml_methods holds Python list literals; parse once per row with literal_eval (no code execution)
+parsed = df["ml_methods"].where(df["ml_methods"].map(lambda x: isinstance(x, str)), "[]").map(ast.literal_eval)
+methods = parsed.explode().dropna()
+method_uri = "<" + BASE + "Method_" + sanitize(methods) + ">"
+method_lines = (
+    article_uri.loc[methods.index] + " " + MENTIONS_METHOD + " " + method_uri + " ."
+    + "\n" + method_uri + " a " + METHOD_CLASS + " ; " + RDFS_LABEL + ' "' + methods + '" .'
+)
+method_text = method_lines.groupby(level=0, sort=False).agg("\n".join).reindex(df.index)
 
-ttl = "@prefix mla: <http://example.com/ml-articles/> .\n" + "\n".join(triples)
+# One chunk per article: its block followed by its method triples
+triples = (article_blocks + ("\n" + method_text).fillna("")).tolist()
 
-with open("out.ttl", "w", encoding="utf-8") as f:
-    f.write(ttl)
-print("Wrote out.ttl")
+def write_ttl(path: str):
+    # Stream chunks straight to disk instead of joining one big string
+    with open(path, "w", encoding="utf-8", buffering=1 << 20) as f:
+        f.write(PREFIX)
+        for i, chunk in enumerate(triples):
+            if i:
+                f.write("\n")
+            f.write(chunk)
+    print(f"Wrote {path}")
 
-r = requests.post(
-    GRAPHDB_UPDATE,
-    data=ttl.encode("utf-8"),
-    headers={"Content-Type": "text/turtle"}
-)
+def upload():
+    # Upload in batches so GraphDB parses smaller transactions; pooled keep-alive connections for all
+    with requests.Session() as session:
+        session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+        for start in range(0, len(triples), BATCH):
+            body = PREFIX + "\n".join(triples[start:start + BATCH])
+            r = session.post(
+                GRAPHDB_UPDATE,
+                data=body.encode("utf-8"),
+                headers={"Content-Type": "text/turtle"}
+            )
+            end = min(start + BATCH, len(triples))
+            if r.status_code >= 300:
+                print(f"Upload failed for articles {start}-{end}:", r.status_code, r.text)
+                break
+            print(f"Uploaded articles {start}-{end}:", r.status_code)
 
-print("Upload status:", r.status_code, r.text)
+# Disk write and upload only read triples, so run them side by side
+with ThreadPoolExecutor(max_workers=2) as ex:
+    written = ex.submit(write_ttl, "out.ttl")
+    uploaded = ex.submit(upload)
+    written.result()
+    uploaded.result()